@@ -3,19 +3,22 @@ import time
 
 from blender import INIT_THRESHOLD
 from common import ms2str, log_print, LogLevel, time_stat
-from testutils import TestResult, parse_result
+from testutils import parse_result
 
 
-def parse_filename(name: str) -> (str, str, str, int):
+def parse_filename(name: str) -> (str, str, str, str, int):
     parts = name.split("_")
     if len(parts) > 4:
         p0 = "_".join(parts[:-3])
         parts = [p0] + parts[-3:]
     model = parts[0]
     version = parts[1]
+    settings = "default"
+    if "@" in version:
+        version, settings = version.split("@", 1)
     renderer = parts[2].upper()
     pass_num = int(parts[3][4:])
-    return model, version, renderer, pass_num
+    return model, version, renderer, settings, pass_num
 
 
 def run():
@@ -31,14 +34,14 @@ def run():
         if filename[1] != "log":
             continue
 
-        model, ver, renderer, pass_num = parse_filename(filename[0])
-        config = (model, ver, renderer)
+        model, ver, renderer, settings, pass_num = parse_filename(filename[0])
+        config = (model, ver, renderer, settings)
 
         with open(os.path.join(log_dir, file)) as src:
             data = src.read()
         it, rt = parse_result(data)
 
-        log_print(LogLevel.I, " ".join([model, ver, renderer, ms2str(rt)]))
+        log_print(LogLevel.I, " ".join([model, ver, renderer, settings, ms2str(rt)]))
         if it > INIT_THRESHOLD:
             log_print(LogLevel.W, f"Kernel init took {it} ms, invalid result!")
             continue
@@ -49,7 +52,10 @@ def run():
 
     log_print(LogLevel.I, "Writing output file")
     with open(out_file, 'w') as out:
-        out.write(TestResult.header() + '\n')
+        # Only columns known from logs, no host: not a result of test run
+        header = ['model', 'version', 'renderer', 'settings',
+                  'passes', 'time_ms', 'time', 'stddev_ms']
+        out.write(';'.join(header) + '\n')
 
         for config, times in results.items():
             rt, dev = time_stat(times)
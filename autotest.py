@@ -1,13 +1,19 @@
+import argparse
 import os
 import platform
 import subprocess
 import time
-from typing import List
+from typing import List, Optional
 from subprocess import CompletedProcess
 from zipfile import ZipFile
 
-from blender import INIT_THRESHOLD, DeviceType, ModelType, BlenderVer, BlenderExe
+from blender import INIT_THRESHOLD, WARMUP_ATTEMPTS, WARMUP_SCENE_EXPR, \
+    DeviceType, DenoiserType, ModelType, BlenderVer, BlenderExe, RenderSettings
 from common import ms2str, log_setup, log_print, LogLevel, time_stat, freq_stat
+from procwatch import RenderWatchdog, run_watched
+from profiler import Profiler, profile_setup, profile_span
+from rapl import RAPL_ROOT, RAPLMeter
+from testplan import TestPlan, load_history, print_plan
 from testutils import TestModel, TestConfig, TestResult, parse_result
 
 try:
@@ -100,31 +106,108 @@ def parse_error(result: CompletedProcess) -> str:
     return "Render failed: " + error
 
 
-def run_test(config: TestConfig) -> List[TestResult]:
-    log_print(LogLevel.I, f"Testing {config.model} with {config.blender.ver()}")
+def warm_up(config: TestConfig, renderer: str,
+            watchdog: RenderWatchdog) -> Optional[int]:
+    """
+        Renders tiny built-in scene to get render kernels
+        compiled and cached for given Blender version and
+        device, returns total warm-up time in milliseconds
+        or None if this device can't be used at all
+    """
+    log_print(LogLevel.I, f"Warming up {config.blender.ver()} in {renderer} mode")
+    args = [
+        config.blender.execPath,
+        '--background', '--factory-startup',
+        '--python-expr', WARMUP_SCENE_EXPR,
+        '--render-output', os.path.join(config.tempDir, "warmup-"),
+        '--render-frame', '1', '--',
+        '--cycles-device', renderer
+    ]
+
+    start = time.perf_counter()
+    for attempt in range(1, WARMUP_ATTEMPTS + 1):
+        with profile_span('warmup', 'test', version=config.blender.versionName,
+                          renderer=renderer, num=attempt):
+            try:
+                result = run_watched(args, watchdog.maxTimeout,
+                                     watchdog.stallTimeout)
+            except subprocess.TimeoutExpired as e:
+                log_print(LogLevel.W, f"Warm-up failed: {e}")
+                return None
+
+        if result.returncode != 0:
+            log_print(LogLevel.W, "Warm-up failed: " + parse_error(result))
+            return None
+
+        it, _ = parse_result(result.stdout)
+        if it <= INIT_THRESHOLD:
+            break
+        log_print(LogLevel.V, f"Kernel init took {it}ms, warming up again")
+    else:
+        log_print(LogLevel.W, f"Kernels still not cached after "
+                              f"{WARMUP_ATTEMPTS} warm-up renders")
+
+    warmup = int(round((time.perf_counter() - start) * 1000))
+    log_print(LogLevel.I, f"Warm-up finished in {ms2str(warmup)}")
+    return warmup
+
+
+def run_test(config: TestConfig, watchdog: RenderWatchdog,
+             warmups: dict = None, pending: dict = None) -> List[TestResult]:
+    """
+        warmups caches warm-up result per (executable, device),
+        pending keeps warm-up times not reported by any result yet
+    """
+    log_print(LogLevel.I, f"Testing {config.model} with {config.blender.ver()}"
+                          f" ({config.settings})")
+
+    if not config.settings.supported_by(config.blender):
+        log_print(LogLevel.W, f"Unable to apply {config.settings}"
+                              f" to {config.blender.ver()}")
+        return []
 
     monitor = CPUFreqWatcher() if config.monitor_cpu else None
+    power = RAPLMeter(config.raplRoot, config.powerInterval) \
+        if config.monitor_power else None
     results = []
 
-    for renderer in DeviceType.all():
-        if renderer == DeviceType.OPTIX \
-                and config.blender.versionCode < BlenderVer.V2_91:
-            log_print(LogLevel.W, f"Unable to run" +
+    for renderer in config.devices:
+        if not config.supports(renderer):
+            log_print(LogLevel.W, f"Unable to test {config.model} with" +
                       f" {config.blender.ver()} in {renderer} mode")
             continue
 
-        if renderer != DeviceType.CPU \
-                and config.blender.versionCode < BlenderVer.V2_91 \
-                and config.model.pathGpu is None:
-            log_print(LogLevel.W, f"Unable to test {config.model} with" +
-                      f" {config.blender.ver()} in {renderer} mode")
+        key = (config.blender.execPath, renderer)
+        if warmups is not None and key not in warmups:
+            if renderer != DeviceType.CPU \
+                    and config.blender.versionCode < BlenderVer.V2_91:
+                # Device can't be set for built-in scene before v2.91,
+                # it would be rendered on CPU leaving GPU kernels cold
+                log_print(LogLevel.W, f"Unable to warm up {config.blender.ver()}"
+                                      f" in {renderer} mode, skipping warm-up")
+                warmups[key] = 0
+            else:
+                warmups[key] = warm_up(config, renderer, watchdog)
+                if warmups[key] is not None and pending is not None:
+                    pending[key] = warmups[key]
+        if warmups is not None and warmups[key] is None:
+            log_print(LogLevel.W, f"Skipping {renderer} mode, warm-up failed")
             continue
 
         cpu_monitoring = monitor is not None and renderer == DeviceType.CPU
 
         args = [
             config.blender.execPath,
-            '--background', config.model.pathCpu,
+            '--background', config.model.pathCpu
+        ]
+
+        expr = config.settings.python_expr(config.blender)
+        if expr is not None:
+            # Failed override must fail the render instead of
+            # silently producing result under the sweep label
+            args += ['--python-exit-code', '1', '--python-expr', expr]
+
+        args += [
             '--render-output', config.outFile,
             '--render-frame', '1', '--',
             '--cycles-device', renderer
@@ -133,69 +216,210 @@ def run_test(config: TestConfig) -> List[TestResult]:
         p = 1
         times = []
         freqs = []
+        powers = []
+        walls = []
         fails = 0
+        timeouts = 0
         while p <= config.passes:
             if fails >= 10:
                 log_print(LogLevel.E, f"Kernel init failed 10 times, test aborted")
                 break
 
-            log_file = f"{config.logPath}_{renderer.lower()}_pass{p:02d}.log"
-            freq_file = f"{config.logPath}_{renderer.lower()}_pass{p:02d}_cpufreq.csv"
-
-            if cpu_monitoring:
-                monitor.run()
-
-            log_print(LogLevel.V, f"Rendering with {renderer} engine (pass {p})...")
-            result = subprocess.run(args, capture_output=True,
-                                    check=False)
-
-            if cpu_monitoring:
-                monitor.stop()
-                freq = monitor.get_stat()
-                log_print(LogLevel.V, f"CPU frequency (min/max/avg): "
-                                      f"{freq.min:.2f}/{freq.max:.2f}/{freq.avg:.2f} MHz")
-                freqs.append(freq)
-                monitor.write_csv(freq_file)
-
-            if result.returncode != 0:
-                log_print(LogLevel.W, parse_error(result))
-                break
-
-            it, rt = parse_result(result.stdout)
-            if it > INIT_THRESHOLD:
-                log_print(LogLevel.W, f"Kernel init took {it}ms, invalid result!")
-                fails += 1
-                continue
-
-            with open(log_file, 'wb') as log:
-                log.write(result.stdout)
-
-            times.append(rt)
-            p += 1
-
-        if len(times) < 1:
+            with profile_span('pass', 'test', model=config.model.name,
+                              version=config.blender.versionName,
+                              settings=config.settings.label(),
+                              renderer=renderer, num=p):
+                log_file = f"{config.logPath}_{renderer.lower()}_pass{p:02d}.log"
+                freq_file = f"{config.logPath}_{renderer.lower()}_pass{p:02d}_cpufreq.csv"
+                power_file = f"{config.logPath}_{renderer.lower()}_pass{p:02d}_power.csv"
+
+                if cpu_monitoring:
+                    with profile_span('monitor-start', 'monitor'):
+                        monitor.run()
+                if power is not None:
+                    with profile_span('power-start', 'monitor'):
+                        power.run()
+
+                timeout = watchdog.timeout_for(config, renderer, walls)
+                log_print(LogLevel.V, f"Rendering with {renderer} engine (pass {p})"
+                                      + (f", timeout {timeout:.0f}s" if timeout else "")
+                                      + "...")
+                start = time.perf_counter()
+                try:
+                    result = run_watched(args, timeout, watchdog.stallTimeout)
+                except subprocess.TimeoutExpired as e:
+                    log_print(LogLevel.E, f"Render killed: {e}")
+                    with open(log_file[:-4] + ".timeout", 'wb') as log:
+                        log.write(e.output or b'')
+                    result = None
+                wall = time.perf_counter() - start
+
+                if power is not None:
+                    with profile_span('power-stop', 'monitor'):
+                        power.stop()
+                        energy = power.get_stat()
+                    log_print(LogLevel.V, "Energy consumption: " + ", ".join(
+                        [f"{e.domain} {e.energy:.2f} J ({e.energy / e.time:.2f} W)"
+                         for e in energy]))
+                    if config.powerInterval:
+                        with profile_span('write-power', 'io'):
+                            power.write_csv(power_file)
+
+                if cpu_monitoring:
+                    with profile_span('monitor-stop', 'monitor'):
+                        monitor.stop()
+                        freq = monitor.get_stat()
+                    log_print(LogLevel.V, f"CPU frequency (min/max/avg): "
+                                          f"{freq.min:.2f}/{freq.max:.2f}/{freq.avg:.2f} MHz")
+                    freqs.append(freq)
+                    with profile_span('write-cpufreq', 'io'):
+                        monitor.write_csv(freq_file)
+
+                if result is None:
+                    # Hung build is likely to hang again, don't waste time on it
+                    timeouts += 1
+                    break
+
+                if result.returncode != 0:
+                    log_print(LogLevel.W, parse_error(result))
+                    break
+
+                with profile_span('parse-result', 'parse'):
+                    it, rt = parse_result(result.stdout)
+                if it > INIT_THRESHOLD:
+                    log_print(LogLevel.W, f"Kernel init took {it}ms, invalid result!")
+                    fails += 1
+                    continue
+
+                with profile_span('write-log', 'io'):
+                    with open(log_file, 'wb') as log:
+                        log.write(result.stdout)
+
+                times.append(rt)
+                walls.append(wall)
+                if power is not None:
+                    powers.append(energy)
+                p += 1
+
+        if len(times) < 1 and timeouts == 0:
             continue
 
-        rt, dev = time_stat(times)
-        dev_percent = dev / rt * 100
-        log_print(LogLevel.I, f"Test finished, average time: {ms2str(rt)}, "
-                  + f"stddev: {dev:.03f} ms ({dev_percent:.02f}%)")
+        if len(times) > 0:
+            rt, dev = time_stat(times)
+            dev_percent = dev / rt * 100
+            log_print(LogLevel.I, f"Test finished, average time: {ms2str(rt)}, "
+                      + f"stddev: {dev:.03f} ms ({dev_percent:.02f}%)")
         result = TestResult(config, renderer, times)
+        # Warm-up time is reported once, by the first result after it
+        if pending is not None and key in pending:
+            result.add_warmup(pending.pop(key))
+        result.add_timeouts(timeouts)
+        result.add_walls(walls)
 
-        if cpu_monitoring:
+        if cpu_monitoring and len(freqs) > 0:
             freq, fdev = freq_stat([freq.avg for freq in freqs])
             fdev_percent = fdev / freq * 100
             log_print(LogLevel.I, f"Average CPU frequency: {freq:.2f} MHz, "
                       + f"stddev: {fdev:.03f} MHz ({fdev_percent:.02f}%)")
             result.add_freq_stat(freqs)
 
+        if len(powers) > 0:
+            result.add_power_stat(powers)
+
         results.append(result)
 
     return results
 
 
-def run():
-    test_passes = 3
+def clean_tmp(tmp_dir: str) -> None:
+    log_print(LogLevel.I, "Deleting temporary files")
+    for file in os.listdir(tmp_dir):
+        os.remove(os.path.join(tmp_dir, file))
+    os.rmdir(tmp_dir)
+
+
+def log_profile(profiler: Profiler, budget: float) -> None:
+    log_print(LogLevel.I, "Harness overhead per pass:")
+    log_print(LogLevel.I, f"{'pass':<48} {'total':>10} {'render':>10} "
+                          f"{'overhead':>10} {'ratio':>7}")
+
+    over_budget = 0
+    for item in profiler.pass_overhead():
+        ratio = item.overhead / item.render if item.render > 0 else 0
+        if ratio > budget:
+            over_budget += 1
+        log_print(LogLevel.I, f"{item.name:<48} {item.total:>10.1f} "
+                              f"{item.render:>10.1f} {item.overhead:>10.1f} "
+                              f"{ratio * 100:>6.2f}%")
+
+    log_print(LogLevel.I, "Harness time by phase (ms):")
+    for name, total in sorted(profiler.category_totals().items()):
+        log_print(LogLevel.I, f"{name:<48} {total:>10.1f}")
+
+    if over_budget > 0:
+        log_print(LogLevel.W, f"Harness overhead exceeds {budget * 100:.1f}% "
+                              f"of render time in {over_budget} passes")
+
+
+def str2bool(value: str) -> bool:
+    value = value.lower()
+    if value in ['1', 'on', 'yes', 'true']:
+        return True
+    if value in ['0', 'off', 'no', 'false']:
+        return False
+    raise argparse.ArgumentTypeError(f"invalid boolean value: '{value}'")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run blender benchmarks")
+    sweep = parser.add_argument_group("render settings sweep",
+                                      "each option takes a list of values, "
+                                      "every combination is tested separately")
+    sweep.add_argument('--samples', type=int, nargs='+',
+                       help="Cycles samples count")
+    sweep.add_argument('--tile-size', type=int, nargs='+',
+                       help="render tile size in pixels")
+    sweep.add_argument('--adaptive', type=str2bool, nargs='+',
+                       help="adaptive sampling on/off")
+    sweep.add_argument('--denoiser', type=str.upper, nargs='+',
+                       choices=DenoiserType.all(),
+                       help="denoiser type")
+    sweep.add_argument('--persistent', type=str2bool, nargs='+',
+                       help="persistent data on/off")
+    parser.add_argument('--plan', type=str,
+                        help="test plan file (.json or .toml)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="print planned jobs and estimated duration only")
+    parser.add_argument('--no-warmup', action='store_true',
+                        help="don't render warm-up scene before tests")
+    parser.add_argument('--rapl-root', type=str, default=RAPL_ROOT,
+                        help="sysfs powercap folder to read RAPL energy "
+                             "counters from (default: %(default)s)")
+    parser.add_argument('--power-interval', type=float, default=0,
+                        help="store energy samples taken every N seconds "
+                             "during render next to pass logs, 0 disables it")
+    parser.add_argument('--stall-timeout', type=float, default=600,
+                        help="kill Blender if it prints nothing for N seconds, "
+                             "0 to disable (default: %(default)s)")
+    parser.add_argument('--max-timeout', type=float, default=0,
+                        help="upper limit of single render in seconds, "
+                             "also used when render time can't be predicted, "
+                             "0 means no limit (default: %(default)s)")
+    parser.add_argument('--timeout-factor', type=float, default=3.0,
+                        help="predicted timeout is expected time multiplied "
+                             "by this factor (default: %(default)s)")
+    parser.add_argument('--timeout-margin', type=float, default=60,
+                        help="seconds added to predicted timeout "
+                             "(default: %(default)s)")
+    parser.add_argument('--profile', action='store_true',
+                        help="profile harness itself and write Chrome trace file")
+    parser.add_argument('--profile-budget', type=float, default=0.05,
+                        help="max allowed harness overhead as a fraction "
+                             "of render time (default: %(default)s)")
+    return parser.parse_args()
+
+
+def run(args: argparse.Namespace):
     monitor_cpu = CPUFreqWatcher is not None
     basedir = os.getcwd()
     log_dir = os.path.join(basedir, 'log')
@@ -209,12 +433,19 @@ def run():
     now = time.strftime('%Y-%m-%d_%H-%M-%S')
     log_file = os.path.join(out_dir, now + ".log")
     out_file = os.path.join(out_dir, now + ".csv")
-    log_setup(log_file)
+    # Dry run only prints the plan, don't leave empty run log behind
+    if not args.dry_run:
+        log_setup(log_file)
 
-    versions = find_blender(basedir)
+    profiler = Profiler() if args.profile else None
+    profile_setup(profiler)
+
+    with profile_span('find-blender', 'discovery'):
+        versions = find_blender(basedir)
     if len(versions) == 0:
         log_print(LogLevel.E, "No any version of Blender found, aborting")
-    models = find_models(basedir)
+    with profile_span('find-models', 'discovery'):
+        models = find_models(basedir)
     if len(versions) == 0:
         log_print(LogLevel.E, "No any test model found, aborting")
 
@@ -225,6 +456,14 @@ def run():
         log_print(LogLevel.W, f"Possible missing dependencies, "
                               f"CPU monitoring and system information is not available")
 
+    meter = RAPLMeter(args.rapl_root)
+    power_domains = meter.domains()
+    if meter.available():
+        log_print(LogLevel.I, f"Found RAPL domains: {', '.join(meter.domains())}")
+    else:
+        log_print(LogLevel.W, "RAPL energy counters are not available, "
+                              "power monitoring disabled")
+
     if GPUtil is not None:
         for gpu in GPUtil.getGPUs():
             log_print(LogLevel.I, f"Found GPU: {gpu.name} (driver: {gpu.driver})")
@@ -232,22 +471,55 @@ def run():
     if get_os_string is not None:
         log_print(LogLevel.I, f"Running on: {get_os_string()}")
 
-    with open(out_file, 'a') as out:
-        out.write(TestResult.header() + '\n')
-
-    for model in models:
-        for exe in versions:
-            config = TestConfig(exe, model, test_passes, monitor_cpu)
-            config.build(tmp_dir, log_dir)
-            result = run_test(config)
+    sweep = RenderSettings.sweep(args.samples, args.tile_size,
+                                 args.adaptive, args.denoiser,
+                                 args.persistent)
+    if len(sweep) > 1:
+        log_print(LogLevel.I, f"Render settings sweep: {len(sweep)} combinations")
+
+    plan = TestPlan.load(args.plan) if args.plan else TestPlan()
+    jobs = plan.build(versions, models, sweep, monitor_cpu,
+                      power_domains=power_domains,
+                      rapl_root=args.rapl_root,
+                      power_interval=args.power_interval)
+
+    # Longest pass wall-clock time of previous runs on this host
+    history = load_history(out_dir, 'wall_max_ms')
+
+    if args.dry_run:
+        print_plan(jobs, history)
+        clean_tmp(tmp_dir)
+        return
+
+    with profile_span('write-csv', 'io'):
+        with open(out_file, 'a') as out:
+            out.write(TestResult.header(power_domains) + '\n')
+
+    # Warm-up results per (executable, device), shared between jobs
+    warmups = None if args.no_warmup else {}
+    pending = {}
+    watchdog = RenderWatchdog(args.timeout_factor, args.timeout_margin,
+                              args.max_timeout, args.stall_timeout,
+                              history)
+
+    for config in jobs:
+        config.build(tmp_dir, log_dir)
+        result = run_test(config, watchdog, warmups, pending)
+        if len(result) == 0:
+            continue
 
+        with profile_span('write-csv', 'io'):
             with open(out_file, 'a') as out:
                 result = '\n'.join([str(r) for r in result])
                 out.write(result + '\n')
 
+    for (exe, renderer), warmup in pending.items():
+        log_print(LogLevel.W, f"Warm-up of {exe} in {renderer} mode took "
+                              f"{ms2str(warmup)}, but no test results reported it")
+
     log_print(LogLevel.I, "Creating result archive")
     zip_file = os.path.join(out_dir, now + ".zip")
-    with ZipFile(zip_file, 'w') as archive:
+    with profile_span('write-zip', 'io'), ZipFile(zip_file, 'w') as archive:
         archive.write('log')
         for file in os.listdir(log_dir):
             path = os.path.join(log_dir, file)
@@ -256,11 +528,15 @@ def run():
         archive.write(out_file, os.path.join('out', now + ".csv"))
         archive.write(log_file, os.path.join('out', now + ".log"))
 
-    log_print(LogLevel.I, "Deleting temporary files")
-    for file in os.listdir(tmp_dir):
-        os.remove(os.path.join(tmp_dir, file))
-    os.rmdir(tmp_dir)
+    clean_tmp(tmp_dir)
+
+    if profiler is not None:
+        profile_setup(None)
+        log_profile(profiler, args.profile_budget)
+        trace_file = os.path.join(out_dir, now + ".trace.json")
+        profiler.write_trace(trace_file)
+        log_print(LogLevel.I, f"Profiling trace saved to {trace_file}")
 
 
 if __name__ == '__main__':
-    run()
+    run(parse_args())
@@ -1,5 +1,8 @@
 from __future__ import annotations
 
+import itertools
+from typing import List, Optional
+
 
 """
     If kernel initialization time took over 100ms
@@ -8,6 +11,23 @@ from __future__ import annotations
 """
 INIT_THRESHOLD = 100
 
+"""
+    Tiny scene rendered with default startup file
+    before real tests to compile or load render kernels,
+    warm-up is repeated up to WARMUP_ATTEMPTS times
+    until kernel initialization fits INIT_THRESHOLD
+"""
+WARMUP_ATTEMPTS = 3
+WARMUP_SCENE_EXPR = "\n".join([
+    "import bpy",
+    "scene = bpy.context.scene",
+    "scene.render.engine = 'CYCLES'",
+    "scene.render.resolution_x = 32",
+    "scene.render.resolution_y = 32",
+    "scene.render.resolution_percentage = 100",
+    "scene.cycles.samples = 1"
+])
+
 
 class DeviceType:
     CPU = 'CPU'
@@ -31,7 +51,24 @@ class ModelType:
 class BlenderVer:
     V2_79 = 27900
     V2_80 = 28000
+    V2_83 = 28300
+    V2_90 = 29000
     V2_91 = 29100
+    V3_00 = 30000
+
+
+class DenoiserType:
+    NONE = 'NONE'
+    OIDN = 'OPENIMAGEDENOISE'
+    OPTIX = 'OPTIX'
+
+    @staticmethod
+    def all():
+        return [
+            DenoiserType.NONE,
+            DenoiserType.OIDN,
+            DenoiserType.OPTIX
+        ]
 
 
 class BlenderExe(object):
@@ -61,3 +98,105 @@ class BlenderExe(object):
 
     def __repr__(self):
         return f"{self.ver()} [{self.versionCode}] in {self.execPath}"
+
+
+class RenderSettings(object):
+    """
+        Cycles settings applied on top of the model's
+        own settings via generated `--python-expr`,
+        `None` means keep the value stored in `.blend` file
+    """
+    samples: int = None
+    tileSize: int = None
+    adaptive: bool = None
+    denoiser: str = None
+    persistent: bool = None
+
+    def __init__(self, samples: int = None, tile_size: int = None,
+                 adaptive: bool = None, denoiser: str = None,
+                 persistent: bool = None):
+        self.samples = samples
+        self.tileSize = tile_size
+        self.adaptive = adaptive
+        self.denoiser = denoiser
+        self.persistent = persistent
+
+    def is_default(self) -> bool:
+        return all(v is None for v in [self.samples, self.tileSize,
+                                       self.adaptive, self.denoiser,
+                                       self.persistent])
+
+    def label(self) -> str:
+        if self.is_default():
+            return "default"
+
+        parts = []
+        if self.samples is not None:
+            parts.append(f"s{self.samples}")
+        if self.tileSize is not None:
+            parts.append(f"t{self.tileSize}")
+        if self.adaptive is not None:
+            parts.append(f"a{int(self.adaptive)}")
+        if self.denoiser is not None:
+            parts.append(f"d{self.denoiser.lower()}")
+        if self.persistent is not None:
+            parts.append(f"p{int(self.persistent)}")
+        return "-".join(parts)
+
+    def supported_by(self, blender: BlenderExe) -> bool:
+        if self.adaptive is not None \
+                and blender.versionCode < BlenderVer.V2_83:
+            return False
+        if self.denoiser is not None \
+                and blender.versionCode < BlenderVer.V2_90:
+            return False
+        if self.denoiser == DenoiserType.OPTIX \
+                and blender.versionCode < BlenderVer.V2_91:
+            return False
+        return True
+
+    def python_expr(self, blender: BlenderExe) -> Optional[str]:
+        if self.is_default():
+            return None
+
+        lines = [
+            "import bpy",
+            "scene = bpy.context.scene"
+        ]
+
+        if self.samples is not None:
+            lines.append(f"scene.cycles.samples = {self.samples}")
+
+        if self.tileSize is not None:
+            if blender.versionCode < BlenderVer.V3_00:
+                lines.append(f"scene.render.tile_x = {self.tileSize}")
+                lines.append(f"scene.render.tile_y = {self.tileSize}")
+            else:
+                lines.append("scene.cycles.use_auto_tile = True")
+                lines.append(f"scene.cycles.tile_size = {self.tileSize}")
+
+        if self.adaptive is not None:
+            lines.append(f"scene.cycles.use_adaptive_sampling = {self.adaptive}")
+
+        if self.denoiser is not None:
+            if self.denoiser == DenoiserType.NONE:
+                lines.append("scene.cycles.use_denoising = False")
+            else:
+                lines.append("scene.cycles.use_denoising = True")
+                lines.append(f"scene.cycles.denoiser = '{self.denoiser}'")
+
+        if self.persistent is not None:
+            lines.append(f"scene.render.use_persistent_data = {self.persistent}")
+
+        return "\n".join(lines)
+
+    @staticmethod
+    def sweep(samples: List[int] = None, tile_sizes: List[int] = None,
+              adaptive: List[bool] = None, denoisers: List[str] = None,
+              persistent: List[bool] = None) -> List[RenderSettings]:
+        grid = [samples, tile_sizes, adaptive, denoisers, persistent]
+        grid = [axis if axis else [None] for axis in grid]
+        return [RenderSettings(*values) for values in itertools.product(*grid)]
+
+    def __repr__(self):
+        return f"settings '{self.label()}'"
@@ -2,6 +2,8 @@ import time
 import statistics
 from typing import List
 
+from profiler import profile_span
+
 
 global_log: str = None
 
@@ -24,8 +26,9 @@ def log_print(level: str, msg: str) -> None:
     print(log)
 
     if global_log is not None:
-        with open(global_log, 'a') as file:
-            file.write(log + '\n')
+        with profile_span('log-write', 'io'):
+            with open(global_log, 'a') as file:
+                file.write(log + '\n')
 
 
 def str2ms(ts: str) -> int:
@@ -57,11 +60,11 @@ def ms2str(ts: int, sep='.') -> str:
 
 def time_stat(times: List[int]) -> (int, float):
     avg = int(round(statistics.fmean(times)))
-    dev = statistics.stdev(times)
+    dev = statistics.stdev(times) if len(times) > 1 else 0.0
     return avg, dev
 
 
 def freq_stat(freqs: List[float]) -> (float, float):
     avg = statistics.mean(freqs)
-    dev = statistics.stdev(freqs)
+    dev = statistics.stdev(freqs) if len(freqs) > 1 else 0.0
     return avg, dev
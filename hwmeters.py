@@ -8,6 +8,8 @@ from typing import List
 import distro
 import psutil
 
+from profiler import profile_span
+
 
 freqsample = namedtuple('freqsample', ['time', 'freq'])
 freqstat = namedtuple('freqstat', ['min', 'max', 'avg'])
@@ -57,6 +59,7 @@ class CPUFreqWatcher(object):
 
     def _watch_loop(self) -> None:
         while self._running:
-            sample = freqsample(time.time(), psutil.cpu_freq().current)
+            with profile_span('cpu-sample', 'monitor'):
+                sample = freqsample(time.time(), psutil.cpu_freq().current)
             self._buffer.append(sample)
             time.sleep(self._interval)
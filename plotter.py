@@ -35,6 +35,14 @@ def make_plot(file_path):
     lh = 0.1
 
     data = pd.read_csv(file_path, sep=";")
+    # Skip tests where every pass was killed by watchdog
+    data = data.dropna(subset=['time_ms'])
+    if 'settings' in data.columns:
+        # Render settings sweep: treat every settings combination
+        # as a separate version to draw them side by side
+        sweep = data['settings'] != 'default'
+        data.loc[sweep, 'version'] = data['version'].astype(str) \
+            + ' ' + data['settings']
     versions = data['version'].unique()
     renderers = data['renderer'].unique()
     model_names = data['model'].unique()
@@ -0,0 +1,163 @@
+import os
+import platform
+import signal
+import subprocess
+import time
+from subprocess import CompletedProcess, TimeoutExpired
+from threading import Thread
+from typing import List, Optional
+
+from profiler import profile_span
+from testutils import TestConfig
+
+
+"""
+    Seconds to wait for output readers after Blender exits
+"""
+READER_TIMEOUT = 10
+
+
+class StallExpired(TimeoutExpired):
+    """
+        Raised when process prints nothing for too long
+    """
+    def __str__(self):
+        return f"Command '{self.cmd}' printed nothing for {self.timeout:.0f} seconds"
+
+
+class RenderWatchdog(object):
+    """
+        Predicts timeout for every render pass from wall-clock
+        time of previous passes of the same config or of past
+        results of exactly the same test on this host
+        and kills hung Blender instances
+    """
+    factor: float = 3.0
+    margin: float = 60.0
+    maxTimeout: float = None
+    stallTimeout: float = None
+    # (model, version, renderer, settings, host) -> [wall_max_ms]
+    history: dict = None
+
+    def __init__(self, factor: float = 3.0, margin: float = 60.0,
+                 max_timeout: float = None, stall_timeout: float = None,
+                 history: dict = None):
+        self.factor = factor
+        self.margin = margin
+        self.maxTimeout = max_timeout or None
+        self.stallTimeout = stall_timeout or None
+        self.history = history or {}
+
+    def timeout_for(self, config: TestConfig, renderer: str,
+                    walls: List[float]) -> Optional[float]:
+        """
+            Returns timeout in seconds, walls is a list of
+            wall-clock durations of previous passes of this config
+        """
+        key = (config.model.name, config.blender.versionName,
+               renderer, config.settings.label(), platform.node())
+
+        expected = None
+        if walls:
+            expected = max(walls)
+        elif key in self.history:
+            expected = max(self.history[key]) / 1000
+
+        if expected is None:
+            return self.maxTimeout
+
+        timeout = expected * self.factor + self.margin
+        if self.maxTimeout is not None:
+            timeout = min(timeout, self.maxTimeout)
+        return timeout
+
+
+def kill_tree(proc: subprocess.Popen) -> None:
+    if os.name == 'nt':
+        subprocess.run(['taskkill', '/F', '/T', '/PID', str(proc.pid)],
+                       capture_output=True, check=False)
+    else:
+        # Process is started in its own session, so its pid is a group id
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def _read_pipe(pipe, buffer: List[bytes], activity: List[float]) -> None:
+    for line in iter(pipe.readline, b''):
+        buffer.append(line)
+        activity[0] = time.monotonic()
+    pipe.close()
+
+
+def _join_readers(readers: List[Thread], timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    for reader in readers:
+        reader.join(max(0.0, deadline - time.monotonic()))
+    return not any(reader.is_alive() for reader in readers)
+
+
+def run_watched(args: List[str], timeout: float = None,
+                stall: float = None, poll: float = 0.5) -> CompletedProcess:
+    """
+        Same as subprocess.run() with captured output, but kills
+        the whole process tree and raises TimeoutExpired when process
+        runs longer than timeout or StallExpired when it prints nothing
+        for stall seconds, partial output is stored in exception
+    """
+    with profile_span('spawn', 'process'):
+        proc = subprocess.Popen(args, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE,
+                                start_new_session=True)
+    start = time.monotonic()
+    activity = [start]
+    stdout = []
+    stderr = []
+    readers = [
+        Thread(target=_read_pipe, args=(proc.stdout, stdout, activity),
+               name="stdout-reader", daemon=True),
+        Thread(target=_read_pipe, args=(proc.stderr, stderr, activity),
+               name="stderr-reader", daemon=True)
+    ]
+
+    error = None
+    try:
+        for reader in readers:
+            reader.start()
+
+        with profile_span('render', 'process'):
+            while True:
+                try:
+                    proc.wait(timeout=poll)
+                    break
+                except TimeoutExpired:
+                    pass
+
+                now = time.monotonic()
+                if timeout is not None and now - start > timeout:
+                    error = TimeoutExpired
+                elif stall is not None and now - activity[0] > stall:
+                    error = StallExpired
+                if error is not None:
+                    kill_tree(proc)
+                    proc.wait()
+                    break
+
+            # Grandchild left behind may still hold pipes open
+            if not _join_readers(readers, READER_TIMEOUT):
+                kill_tree(proc)
+                _join_readers(readers, READER_TIMEOUT)
+    except BaseException:
+        # Blender runs in its own session, so it doesn't get
+        # terminal signals and must not outlive the harness
+        kill_tree(proc)
+        proc.wait()
+        raise
+
+    stdout = b''.join(stdout)
+    stderr = b''.join(stderr)
+    if error is not None:
+        raise error(args, timeout if error is TimeoutExpired else stall,
+                    output=stdout, stderr=stderr)
+    return CompletedProcess(args, proc.returncode, stdout, stderr)
@@ -0,0 +1,102 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager, nullcontext
+from typing import List
+
+
+global_profiler = None
+
+passoverhead = namedtuple('passoverhead', ['name', 'total', 'render', 'overhead'])
+
+
+class Profiler(object):
+    """
+        Collects harness timings and stores them
+        in Chrome trace-event format, which can be
+        opened with chrome://tracing or Perfetto UI
+    """
+    _start: float = None
+    _events: List[dict] = None
+    _threads: dict = None
+
+    def __init__(self):
+        self._start = time.perf_counter()
+        self._events = []
+        self._threads = {}
+
+    def _now_us(self) -> float:
+        return (time.perf_counter() - self._start) * 1e6
+
+    def _thread_id(self) -> int:
+        thread = threading.current_thread()
+        if thread.ident not in self._threads:
+            self._threads[thread.ident] = thread.name
+        return thread.ident
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args):
+        tid = self._thread_id()
+        start = self._now_us()
+        try:
+            yield
+        finally:
+            self._events.append({
+                'name': name, 'cat': cat, 'ph': 'X',
+                'ts': start, 'dur': self._now_us() - start,
+                'pid': os.getpid(), 'tid': tid, 'args': args
+            })
+
+    def pass_overhead(self) -> List[passoverhead]:
+        """
+            For every 'pass' span returns its total duration,
+            time spent in the render process and everything else
+            (harness overhead), all values in milliseconds
+        """
+        passes = [e for e in self._events if e['name'] == 'pass']
+        renders = [e for e in self._events if e['name'] == 'render']
+        result = []
+
+        for p in sorted(passes, key=lambda e: e['ts']):
+            end = p['ts'] + p['dur']
+            render = sum(r['dur'] for r in renders
+                         if r['tid'] == p['tid']
+                         and p['ts'] <= r['ts'] <= end)
+            name = " ".join(str(v) for v in p['args'].values())
+            result.append(passoverhead(name=name, total=p['dur'] / 1000,
+                                       render=render / 1000,
+                                       overhead=(p['dur'] - render) / 1000))
+        return result
+
+    def category_totals(self) -> dict:
+        totals = {}
+        for e in self._events:
+            key = f"{e['cat']}/{e['name']}"
+            totals[key] = totals.get(key, 0) + e['dur'] / 1000
+        return totals
+
+    def write_trace(self, file: str) -> None:
+        meta = [{
+            'name': 'thread_name', 'ph': 'M',
+            'pid': os.getpid(), 'tid': tid,
+            'args': {'name': name}
+        } for tid, name in self._threads.items()]
+
+        with open(file, 'w') as out:
+            json.dump({
+                'traceEvents': meta + self._events,
+                'displayTimeUnit': 'ms'
+            }, out)
+
+
+def profile_setup(profiler: Profiler) -> None:
+    global global_profiler
+    global_profiler = profiler
+
+
+def profile_span(name: str, cat: str, **args):
+    if global_profiler is None:
+        return nullcontext()
+    return global_profiler.span(name, cat, **args)
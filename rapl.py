@@ -0,0 +1,139 @@
+import glob
+import os
+import time
+from collections import namedtuple
+from threading import Event, Thread
+from typing import List
+
+from profiler import profile_span
+
+
+energysample = namedtuple('energysample', ['time', 'energy'])
+powerstat = namedtuple('powerstat', ['domain', 'energy', 'time'])
+
+RAPL_ROOT = '/sys/class/powercap'
+
+"""
+    Upper estimate of single RAPL domain power, used to
+    choose sampling interval short enough to never miss
+    more than one energy counter wraparound
+"""
+RAPL_MAX_POWER = 1000
+
+
+class RAPLMeter(object):
+    """
+        Reads energy counters of Intel RAPL package and DRAM
+        domains from sysfs, counters are sampled in background
+        at least twice per shortest possible wraparound period,
+        which is derived from `max_energy_range_uj`, so every
+        wraparound is handled between two readings
+    """
+    _root: str = RAPL_ROOT
+    _interval: float = None
+    _stopped: Event = None
+    _thread: Thread = None
+
+    # domain -> (energy_uj path, max_energy_range_uj)
+    _domains: dict = None
+    _start: float = None
+    _end: float = None
+    _last: dict = None
+    _energy: dict = None
+    _buffer: List[energysample] = None
+
+    def __init__(self, root: str = RAPL_ROOT, interval: float = None):
+        self._root = root
+        self._domains = self._find_domains()
+        self._interval = self._safe_interval()
+        if interval:
+            self._interval = min(interval, self._interval)
+
+    def _safe_interval(self) -> float:
+        if not self._domains:
+            return 0
+        max_range = min(r for _, r in self._domains.values())
+        return max_range / 1e6 / RAPL_MAX_POWER / 2
+
+    def _find_domains(self) -> dict:
+        domains = {}
+        for zone in sorted(glob.glob(os.path.join(self._root, 'intel-rapl:*'))):
+            energy_file = os.path.join(zone, 'energy_uj')
+            if not os.access(energy_file, os.R_OK):
+                continue
+
+            with open(os.path.join(zone, 'name')) as src:
+                name = src.read().strip()
+            if name == 'dram':
+                # DRAM is a subzone of package: intel-rapl:<package>:<n>
+                name = f"dram-{os.path.basename(zone).split(':')[1]}"
+            if not (name.startswith('package') or name.startswith('dram')) \
+                    or name in domains:
+                continue
+
+            with open(os.path.join(zone, 'max_energy_range_uj')) as src:
+                max_range = int(src.read().strip())
+            domains[name] = (energy_file, max_range)
+        return domains
+
+    def available(self) -> bool:
+        return len(self._domains) > 0
+
+    def domains(self) -> List[str]:
+        return list(self._domains.keys())
+
+    def _read(self) -> dict:
+        values = {}
+        for name, (path, _) in self._domains.items():
+            with open(path) as src:
+                values[name] = int(src.read().strip())
+        return values
+
+    def _update(self) -> None:
+        values = self._read()
+        for name, value in values.items():
+            delta = value - self._last[name]
+            if delta < 0:
+                delta += self._domains[name][1] + 1
+            self._energy[name] += delta
+        self._last = values
+        self._buffer.append(energysample(time.time(), dict(self._energy)))
+
+    def run(self) -> None:
+        self._buffer = []
+        self._energy = {name: 0 for name in self._domains}
+        self._last = self._read()
+        self._start = time.perf_counter()
+        self._stopped = Event()
+        if self._interval > 0:
+            self._thread = Thread(target=self._watch_loop, name="power-monitor")
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._update()
+        self._end = time.perf_counter()
+
+    def get_stat(self) -> List[powerstat]:
+        duration = self._end - self._start
+        return [powerstat(domain=name, energy=energy / 1e6, time=duration)
+                for name, energy in self._energy.items()]
+
+    def get_csv_header(self, sep: str = ";") -> str:
+        return sep.join(["time"] + [f"{name}_uj" for name in self._domains])
+
+    def write_csv(self, file: str, sep: str = ";") -> None:
+        with open(file, 'a') as out:
+            out.write(self.get_csv_header(sep) + '\n')
+            for item in self._buffer:
+                out.write(sep.join([str(item.time)] + [
+                    str(item.energy[name]) for name in self._domains]) + '\n')
+
+    def _watch_loop(self) -> None:
+        # Waiting on event lets stop() interrupt sampling immediately
+        while not self._stopped.wait(self._interval):
+            with profile_span('power-sample', 'monitor'):
+                self._update()
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import fnmatch
+import json
+import os
+import platform
+import statistics
+from typing import List, Union
+
+from blender import DeviceType, BlenderExe, RenderSettings
+from common import ms2str, log_print, LogLevel
+from testutils import TestModel, TestConfig, read_results
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+
+class ModelPlan(object):
+    passes: int = None
+    devices: List[str] = None
+    priority: int = 0
+
+    def __init__(self, passes: int, devices: List[str], priority: int = 0):
+        self.passes = passes
+        self.devices = devices
+        self.priority = priority
+
+
+class TestPlan(object):
+    """
+        Declarative description of what to test, loaded from
+        `.json` or `.toml` file, for example:
+
+            passes = 3
+            devices = ["CPU", "CUDA"]
+
+            [versions]
+            include = ["3.*", "4.*"]
+            exclude = ["3.0.*"]
+
+            [models]
+            exclude = ["heavy_*"]
+
+            [models.classroom]
+            passes = 5
+            devices = ["CPU"]
+            priority = 10
+
+        Every name in the `models` table except `include` and
+        `exclude` is a per-model override, models with higher
+        priority are tested first within every Blender version.
+    """
+    passes: int = 3
+    devices: List[str] = None
+    versionInclude: List[str] = None
+    versionExclude: List[str] = None
+    modelInclude: List[str] = None
+    modelExclude: List[str] = None
+    overrides: dict = None
+
+    def __init__(self, data: dict = None):
+        data = data or {}
+        versions = data.get('versions', {})
+        models = data.get('models', {})
+
+        self.passes = self._parse_passes(data.get('passes', 3))
+        self.devices = self._parse_devices(data.get('devices', DeviceType.all()))
+        self.versionInclude = versions.get('include', ['*'])
+        self.versionExclude = versions.get('exclude', [])
+        self.modelInclude = models.get('include', ['*'])
+        self.modelExclude = models.get('exclude', [])
+        self.overrides = {}
+
+        for name, opts in models.items():
+            if name in ['include', 'exclude']:
+                continue
+            self.overrides[name] = ModelPlan(
+                self._parse_passes(opts.get('passes', self.passes)),
+                self._parse_devices(opts.get('devices', self.devices)),
+                int(opts.get('priority', 0)))
+
+    @staticmethod
+    def _parse_passes(passes) -> int:
+        passes = int(passes)
+        if passes < 1:
+            raise ValueError(f"passes count must be at least 1, got {passes}")
+        return passes
+
+    @staticmethod
+    def _parse_devices(devices: Union[str, List[str]]) -> List[str]:
+        if isinstance(devices, str):
+            devices = [devices]
+        if not isinstance(devices, list):
+            raise ValueError(f"devices must be a list, got {devices!r}")
+        devices = [str(d).upper() for d in devices]
+        for device in devices:
+            if device not in DeviceType.all():
+                raise ValueError(f"unknown device type: '{device}'")
+        return devices
+
+    @staticmethod
+    def _match(name: str, include: List[str], exclude: List[str]) -> bool:
+        if not any(fnmatch.fnmatchcase(name, p) for p in include):
+            return False
+        return not any(fnmatch.fnmatchcase(name, p) for p in exclude)
+
+    @staticmethod
+    def load(path: str) -> TestPlan:
+        ext = os.path.splitext(path)[1].lower()
+        if ext == '.toml':
+            if tomllib is None:
+                raise RuntimeError("TOML test plans requires Python 3.11+")
+            with open(path, 'rb') as src:
+                return TestPlan(tomllib.load(src))
+
+        with open(path) as src:
+            return TestPlan(json.load(src))
+
+    def model_plan(self, model: TestModel) -> ModelPlan:
+        if model.name in self.overrides:
+            return self.overrides[model.name]
+        return ModelPlan(self.passes, self.devices)
+
+    def build(self, versions: List[BlenderExe], models: List[TestModel],
+              sweep: List[RenderSettings], monitor_cpu: bool,
+              **options) -> List[TestConfig]:
+        """
+            Returns jobs in version-major order, so every Blender
+            binary (and its compiled kernels) is used by all jobs
+            in a row before switching to the next one,
+            options are passed to every TestConfig as is
+        """
+        unknown = set(self.overrides) - set(m.name for m in models)
+        if unknown:
+            raise ValueError(f"test plan overrides unknown models: "
+                             f"{', '.join(sorted(unknown))}")
+
+        versions = [v for v in versions if self._match(
+            v.versionName, self.versionInclude, self.versionExclude)]
+        models = [m for m in models if self._match(
+            m.name, self.modelInclude, self.modelExclude)]
+        models = sorted(models, key=lambda m: -self.model_plan(m).priority)
+
+        jobs = []
+        for exe in versions:
+            for model in models:
+                plan = self.model_plan(model)
+                for settings in sweep:
+                    config = TestConfig(exe, model, plan.passes, monitor_cpu,
+                                        settings, plan.devices, **options)
+                    jobs.append(config)
+        return jobs
+
+
+def load_history(out_dir: str, column: str = 'time_ms') -> dict:
+    """
+        Collects values of given time column from all
+        previous result files in given folder
+    """
+    history = {}
+    if not os.path.isdir(out_dir):
+        return history
+
+    for file in sorted(os.listdir(out_dir)):
+        if not file.endswith('.csv'):
+            continue
+        for row in read_results(os.path.join(out_dir, file)):
+            if not row.get(column):
+                continue
+            key = (row['model'], row['version'], row['renderer'],
+                   row.get('settings') or 'default',
+                   row.get('host') or 'unknown')
+            history.setdefault(key, []).append(int(row[column]))
+
+    return history
+
+
+def history_time(config: TestConfig, renderer: str, history: dict):
+    """
+        Average wall-clock time of single render pass in
+        milliseconds or None if exactly this test was
+        never run on this host before
+    """
+    key = (config.model.name, config.blender.versionName,
+           renderer, config.settings.label(), platform.node())
+    if key in history:
+        return statistics.fmean(history[key])
+    return None
+
+
+def estimate_time(config: TestConfig, renderer: str, history: dict):
+    pass_time = history_time(config, renderer, history)
+    if pass_time is None:
+        return None
+    return pass_time * config.passes
+
+
+def print_plan(jobs: List[TestConfig], history: dict) -> None:
+    """
+        Prints planned runs with estimates, history
+        must be loaded from `wall_max_ms` column
+    """
+    total = 0
+    unknown = 0
+
+    # Same filters as in run_test(), skipped renders aren't estimated
+    jobs = [c for c in jobs if c.settings.supported_by(c.blender)]
+
+    log_print(LogLevel.I, f"Test plan: {len(jobs)} jobs")
+    for config in jobs:
+        for renderer in filter(config.supports, config.devices):
+            estimate = estimate_time(config, renderer, history)
+            if estimate is None:
+                unknown += 1
+                estimate = "unknown"
+            else:
+                total += estimate
+                estimate = ms2str(int(estimate))
+            log_print(LogLevel.I, f"{config.blender.ver()} | {config.model.name}"
+                                  f" | {config.settings.label()} | {renderer}"
+                                  f" | {config.passes} passes | {estimate}")
+
+    log_print(LogLevel.I, f"Estimated duration: {ms2str(int(total))}"
+                          + (f" (+{unknown} runs without previous results)"
+                             if unknown > 0 else ""))
@@ -1,14 +1,17 @@
 from __future__ import annotations
 
 import copy
+import csv
 import os
+import platform
 import re
 import statistics
-from typing import List, Union
+from typing import Iterator, List, Union
 
-from blender import BlenderExe
+from blender import DeviceType, BlenderVer, BlenderExe, RenderSettings
 from common import ms2str, str2ms, time_stat
 from hwmeters import freqstat
+from rapl import RAPL_ROOT, powerstat
 
 
 class TestModel(object):
@@ -41,8 +44,13 @@ class TestModel(object):
 class TestConfig(object):
     blender: BlenderExe = None
     model: TestModel = None
+    settings: RenderSettings = None
+    devices: List[str] = None
     passes: int = None
     monitor_cpu: bool = None
+    powerDomains: List[str] = None
+    raplRoot: str = None
+    powerInterval: float = None
 
     tempDir: str = None
     logPath: str = None
@@ -50,14 +58,41 @@ class TestConfig(object):
 
     def __init__(self, blender: BlenderExe,
                  model: TestModel, passes: int = 3,
-                 monitor_cpu: bool = True):
+                 monitor_cpu: bool = True,
+                 settings: RenderSettings = None,
+                 devices: List[str] = None,
+                 power_domains: List[str] = None,
+                 rapl_root: str = RAPL_ROOT,
+                 power_interval: float = None):
+        self.powerDomains = power_domains or []
+        self.raplRoot = rapl_root
+        self.powerInterval = power_interval
+        self.settings = settings if settings is not None else RenderSettings()
+        self.devices = devices if devices is not None else DeviceType.all()
         self.passes = passes
         self.monitor_cpu = monitor_cpu
         self.blender = blender
         self.model = model
 
+    @property
+    def monitor_power(self) -> bool:
+        return len(self.powerDomains) > 0
+
+    def supports(self, renderer: str) -> bool:
+        if renderer == DeviceType.OPTIX \
+                and self.blender.versionCode < BlenderVer.V2_91:
+            return False
+        # Render engine can't be overridden before v2.91
+        if renderer != DeviceType.CPU \
+                and self.blender.versionCode < BlenderVer.V2_91 \
+                and self.model.pathGpu is None:
+            return False
+        return True
+
     def build(self, tmp_dir: str, log_dir: str) -> None:
         name = f"{self.model.name}_{self.blender.versionName}"
+        if not self.settings.is_default():
+            name += f"@{self.settings.label()}"
         self.logPath = os.path.join(log_dir, name)
         self.tempDir = tmp_dir
         self.outFile = os.path.join(self.tempDir, "render-")
@@ -67,21 +102,56 @@ class TestResult(object):
     passes: int = None
     blender: BlenderExe = None
     model: TestModel = None
+    settings: RenderSettings = None
     renderer: str = None
+    host: str = None
+    powerDomains: List[str] = None
+    warmup: int = None
+    timeouts: int = 0
     times: List[int] = None
+    walls: List[float] = None
     freqs: List[freqstat] = None
+    powers: List[List[powerstat]] = None
 
     def __init__(self, config: TestConfig,
                  renderer: str, times: List[int]):
         self.model = config.model
         self.blender = config.blender
+        self.settings = config.settings
         self.passes = config.passes
         self.renderer = renderer
+        self.host = platform.node()
+        self.powerDomains = config.powerDomains
         self.times = times
 
+    def add_walls(self, walls: List[float]):
+        self.walls = copy.copy(walls)
+
+    def add_timeouts(self, timeouts: int):
+        self.timeouts = timeouts
+
+    def add_warmup(self, warmup: int):
+        self.warmup = warmup
+
     def add_freq_stat(self, stats: List[freqstat]):
         self.freqs = copy.copy(stats)
 
+    def add_power_stat(self, stats: List[List[powerstat]]):
+        self.powers = copy.copy(stats)
+
+    def _energy(self, domains: List[str]) -> List[str]:
+        """
+            Average energy per pass in joules and average power
+            in watts summed over given domains, empty if nothing
+            was measured
+        """
+        if not self.powers or not domains:
+            return ["", ""]
+        energy = [sum(s.energy for s in stats if s.domain in domains)
+                  for stats in self.powers]
+        duration = sum(stats[0].time for stats in self.powers)
+        return [f"{statistics.fmean(energy):.03f}", f"{sum(energy) / duration:.03f}"]
+
     @property
     def cpufreq_max(self) -> float:
         if not self.freqs:
@@ -95,34 +165,68 @@ class TestResult(object):
         return statistics.fmean([freq.avg for freq in self.freqs])
 
     def __str__(self):
-        avg, dev = time_stat(self.times)
+        if self.times:
+            avg, dev = time_stat(self.times)
+            stat = [str(avg), ms2str(avg), f"{dev:.03f}"]
+        else:
+            # All passes timed out, no time to report
+            stat = ["", "", ""]
+
+        packages = [d for d in self.powerDomains if d.startswith('package')]
+        drams = [d for d in self.powerDomains if d.startswith('dram')]
+
         return ";".join([
             self.model.name,
             self.blender.versionName,
             self.renderer,
+            self.settings.label(),
             str(self.passes),
-            str(avg),
-            ms2str(avg),
-            f"{dev:.03f}",
+            *stat,
             f"{self.cpufreq_max:.03f}",
             f"{self.cpufreq_avg:.03f}",
+            str(self.warmup) if self.warmup is not None else "",
+            str(self.timeouts),
+            str(int(max(self.walls) * 1000)) if self.walls else "",
+            # Totals over all sockets, then every domain on its own
+            *self._energy(packages),
+            *self._energy(drams),
+            *[v for d in self.powerDomains for v in self._energy([d])],
+            self.host,
         ])
 
     @staticmethod
-    def header():
+    def header(power_domains: List[str] = None):
         return ";".join([
             'model',
             'version',
             'renderer',
+            'settings',
             'passes',
             'time_ms',
             'time',
             'stddev_ms',
             'cpufreq_max',
-            'cpufreq_avg'
+            'cpufreq_avg',
+            'warmup_ms',
+            'timeouts',
+            'wall_max_ms',
+            'energy_pkg_j',
+            'power_pkg_w',
+            'energy_dram_j',
+            'power_dram_w',
+            *[c for d in power_domains or []
+              for c in [f'energy_{d}_j', f'power_{d}_w']],
+            'host'
         ])
 
 
+def read_results(file: str) -> Iterator[dict]:
+    with open(file, newline='') as src:
+        for row in csv.DictReader(src, delimiter=';'):
+            if row.get('time_ms'):
+                yield row
+
+
 def time_from_log(line: List[str]) -> int:
     return str2ms(line[1][5:])
 
@@ -173,5 +277,9 @@ def parse_result(result: Union[bytes, str]) -> (int, int):
             init_end = time_from_log(line)
             break
 
+    if init_start is None or init_end is None:
+        # No kernel loading reported, nothing to compile
+        return 0, render_time
+
     init_time = init_end - init_start
     return init_time, render_time
@@ -0,0 +1,189 @@
+import base64
+import csv
+import io
+import os.path
+import time
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+from matplotlib.ticker import FuncFormatter
+
+from common import log_print, LogLevel
+from plotter import time_format
+from testutils import read_results
+
+
+class TrendSeries(object):
+    """
+        Time series with bounded memory: samples are collected
+        into equal-width buckets keeping count/sum of values and
+        min/max of sample bounds, when number of buckets reaches
+        the limit neighbours are merged pairwise and bucket width
+        is doubled. Samples must be added in chronological order.
+    """
+    _limit: int = None
+    _width: int = 1
+    _buckets: List[list] = None
+
+    def __init__(self, limit: int = 256):
+        # Even limit keeps all merged buckets of the same width
+        self._limit = max(2, limit - limit % 2)
+        self._width = 1
+        self._buckets = []
+
+    def add(self, ts: float, value: float,
+            low: float = None, high: float = None) -> None:
+        # Bucket: [start, end, count, sum, min, max]
+        low = value if low is None else low
+        high = value if high is None else high
+        if self._buckets and self._buckets[-1][2] < self._width:
+            last = self._buckets[-1]
+            last[1] = ts
+            last[2] += 1
+            last[3] += value
+            last[4] = min(last[4], low)
+            last[5] = max(last[5], high)
+            return
+
+        if len(self._buckets) >= self._limit:
+            self._compact()
+            self.add(ts, value, low, high)
+            return
+
+        self._buckets.append([ts, ts, 1, value, low, high])
+
+    def _compact(self) -> None:
+        merged = []
+        for i in range(0, len(self._buckets), 2):
+            pair = self._buckets[i:i + 2]
+            merged.append([
+                pair[0][0], pair[-1][1],
+                sum(b[2] for b in pair), sum(b[3] for b in pair),
+                min(b[4] for b in pair), max(b[5] for b in pair)
+            ])
+        self._buckets = merged
+        self._width *= 2
+
+    def points(self) -> Tuple[List[float], List[float], List[float], List[float]]:
+        ts = [(b[0] + b[1]) / 2 for b in self._buckets]
+        avg = [b[3] / b[2] for b in self._buckets]
+        low = [b[4] for b in self._buckets]
+        high = [b[5] for b in self._buckets]
+        return ts, avg, low, high
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def run_timestamp(path: str) -> float:
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        return time.mktime(time.strptime(name, '%Y-%m-%d_%H-%M-%S'))
+    except ValueError:
+        return os.path.getmtime(path)
+
+
+def is_run_result(path: str) -> bool:
+    """
+        Tells results of autotest.py runs from summaries made by
+        analyzer.py of the same logs, only the former have hosts
+    """
+    with open(path, newline='') as src:
+        header = next(csv.reader(src, delimiter=';'), [])
+    return 'host' in header
+
+
+def collect(out_dir: str, limit: int) -> Dict[tuple, TrendSeries]:
+    files = [os.path.join(out_dir, f) for f in os.listdir(out_dir)
+             if f.endswith('.csv')]
+    files = sorted(filter(is_run_result, files), key=run_timestamp)
+    series = {}
+
+    # Rows are read one by one, only downsampled series are kept in memory
+    for file in files:
+        ts = run_timestamp(file)
+        for row in read_results(file):
+            key = (row['model'], row['version'], row['renderer'],
+                   row.get('settings') or 'default',
+                   row.get('host') or 'unknown')
+            if key not in series:
+                series[key] = TrendSeries(limit)
+            # Every row is an average, its spread is kept in the band
+            avg = int(row['time_ms'])
+            dev = float(row.get('stddev_ms') or 0)
+            series[key].add(ts, avg, avg - dev, avg + dev)
+
+    log_print(LogLevel.I, f"Loaded {len(files)} result files, "
+                          f"{len(series)} series")
+    return series
+
+
+def make_figure(model: str, series: Dict[tuple, TrendSeries]) -> str:
+    fig, ax = plt.subplots(figsize=(12, 5))
+    fig.set_dpi(100)
+
+    for key, s in sorted(series.items()):
+        ts, avg, low, high = s.points()
+        dates = [datetime.fromtimestamp(t) for t in ts]
+        label = " ".join(k for k in key[1:] if k not in ['default', 'unknown'])
+        line, = ax.plot(dates, avg, '-', marker='.', label=label)
+        ax.fill_between(dates, low, high, color=line.get_color(), alpha=0.2)
+
+    ax.yaxis.set_major_formatter(FuncFormatter(time_format))
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%Y-%m-%d'))
+    ax.grid(color='gray', linestyle=':')
+    ax.set_title(model)
+    ax.legend(loc='upper left', bbox_to_anchor=(1.01, 1), fontsize=8)
+    fig.autofmt_xdate()
+    plt.tight_layout()
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def make_report(series: Dict[tuple, TrendSeries], file: str) -> None:
+    models = sorted(set(key[0] for key in series))
+    html = [
+        "<!DOCTYPE html>",
+        "<html><head><meta charset='utf-8'><title>Render time trends</title></head>",
+        "<body>",
+        "<h1>Render time trends</h1>",
+        f"<p>Generated {time.strftime('%Y-%m-%d %H:%M:%S')}, "
+        f"lines shows average, bands shows min/max of average &plusmn; "
+        f"stddev render time</p>"
+    ]
+
+    for model in models:
+        current = {k: v for k, v in series.items() if k[0] == model}
+        image = make_figure(model, current)
+        html.append(f"<h2>{model}</h2>")
+        html.append(f"<img src='data:image/png;base64,{image}'/>")
+
+    html.append("</body></html>")
+    with open(file, 'w') as out:
+        out.write('\n'.join(html))
+
+
+def run(limit: int = 256):
+    basedir = os.getcwd()
+    out_dir = os.path.join(basedir, 'out')
+    now = time.strftime('%Y-%m-%d_%H-%M-%S')
+
+    series = collect(out_dir, limit)
+    if len(series) == 0:
+        log_print(LogLevel.E, "No any results found, aborting")
+        return
+
+    report = os.path.join(out_dir, f"trend_{now}.html")
+    make_report(series, report)
+    log_print(LogLevel.I, f"Trend report saved to {report}")
+
+
+if __name__ == '__main__':
+    run()